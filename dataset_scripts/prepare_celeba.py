@@ -1,10 +1,13 @@
+import heapq
 import os
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from pathlib import Path
 import zipfile
 import gdown
-from torchvision import transforms
 import cv2
 import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
 base_path = Path(__file__).parent.parent / "datasets"
@@ -14,6 +17,13 @@ source_path = raw_path / "celeba_hq"
 txt_path = base_path / "identity_CelebA.txt"
 zip_path = base_path / "celeba_hq.zip"
 
+# Baseline (non-progressive, non-optimized) JPEG encoding for the output images
+JPEG_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, 90,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+]
+
 
 def download_celeba():
     """Download CelebA-HQ dataset using gdown"""
@@ -65,6 +75,21 @@ def extract_dataset():
     return True
 
 
+def init_worker():
+    """Keep each worker's OpenCV single-threaded; the pool already uses every core"""
+    cv2.setNumThreads(1)
+
+
+def process_image(task):
+    """Resize a single image and save it to its target path"""
+    img_path, save_path = task
+    img = cv2.imread(img_path)
+    if img is None:
+        return False
+    img = cv2.resize(img, (528, 528), interpolation=cv2.INTER_LANCZOS4)
+    return cv2.imwrite(save_path, img, JPEG_PARAMS)
+
+
 def prepare_dataset():
     """Prepare CelebA-HQ dataset"""
     if (
@@ -75,19 +100,17 @@ def prepare_dataset():
         return
 
     # First, let's count images per identity
-    identity_counts = {}
-    identity_mapping = {}
-
     print("Analyzing identity distribution...")
-    with open(txt_path, "r") as f:
-        for line in f:
-            img_name, identity = line.strip().split()
-            identity = int(identity)
-            identity_counts[identity] = identity_counts.get(identity, 0) + 1
-            identity_mapping[img_name] = identity
-
-    # Get top 4 identities by image count
-    identities = sorted(identity_counts.items(), key=lambda x: x[1], reverse=True)
+    identities_df = pd.read_csv(
+        txt_path, sep=r"\s+", header=None, names=["img", "id"], dtype={"id": np.int32}
+    )
+    identity_counts = identities_df.groupby("id", sort=False).size().to_dict()
+    identity_mapping = dict(
+        zip(identities_df["img"].tolist(), identities_df["id"].tolist())
+    )
+
+    # Get top 4 identities by image count (skipping the 3rd and 4th largest)
+    identities = heapq.nlargest(6, identity_counts.items(), key=itemgetter(1))
     top_identities = [identities[i] for i in [0, 1, 4, 5]]
     selected_individuals = {
         f"person_{i+1}": id for i, (id, count) in enumerate(top_identities)
@@ -112,33 +135,54 @@ def prepare_dataset():
     processed_counts = {name: 0 for name in selected_individuals.keys()}
 
     # List all images and process them
-    all_images = sorted(list(img_dir.glob("*.jpg")))
+    with os.scandir(img_dir) as entries:
+        all_images = sorted(
+            (entry for entry in entries if entry.name.endswith(".jpg")),
+            key=lambda entry: entry.name,
+        )
     print(f"Found {len(all_images)} images.")
 
-    for img_path in tqdm(all_images):
-        img_name = img_path.name
-        if img_name in identity_mapping:
-            identity_id = identity_mapping[img_name]
-
-            # Check if this image belongs to our selected individuals
-            for person_name, target_id in selected_individuals.items():
-                if identity_id == target_id:
-                    # Open, resize and save image
-                    img = cv2.imread(str(img_path))
-                    img = cv2.resize(img, (528, 528), interpolation=cv2.INTER_LANCZOS4)
-                    save_path = (
-                        data_path
-                        / person_name
-                        / f"{person_name}_{processed_counts[person_name]:04d}.jpg"
-                    )
-                    cv2.imwrite(str(save_path), img)
-                    processed_counts[person_name] += 1
-                    break
-
-            # Check if we have enough images for all individuals
-            if all(count >= 100 for count in processed_counts.values()):
+    # Assign output paths up front so the workers don't share any counters
+    id_to_person = {
+        target_id: person_name
+        for person_name, target_id in selected_individuals.items()
+    }
+    remaining = set(processed_counts)
+    tasks = []
+    for img_entry in all_images:
+        # Check if this image belongs to our selected individuals
+        person_name = id_to_person.get(identity_mapping.get(img_entry.name))
+        if person_name is None:
+            continue
+
+        save_path = (
+            data_path
+            / person_name
+            / f"{person_name}_{processed_counts[person_name]:04d}.jpg"
+        )
+        # Skip images already written by a previous run
+        if not save_path.exists():
+            tasks.append((img_entry.path, str(save_path)))
+        processed_counts[person_name] += 1
+
+        # Check if we have enough images for all individuals
+        if processed_counts[person_name] >= 100:
+            remaining.discard(person_name)
+            if not remaining:
                 break
 
+    # Open, resize and save images in parallel
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(), initializer=init_worker
+    ) as executor:
+        results = list(
+            tqdm(executor.map(process_image, tasks, chunksize=32), total=len(tasks))
+        )
+
+    failed = results.count(False)
+    if failed:
+        print(f"Failed to process {failed} images.")
+
     print("\nDataset preparation complete!")
     for person, count in processed_counts.items():
         print(f"{person}: {count} images")
@@ -1,11 +1,9 @@
 import os
 import shutil
 from pathlib import Path
-from tqdm import tqdm
-import requests
 import tarfile
-from PIL import Image
-import urllib.request
+
+from utils import download_file, extract_zip
 
 base_path = Path(__file__).parent.parent / "datasets"
 zip_path = base_path / "tiny-imagenet-200.zip"
@@ -20,23 +18,14 @@ def download_tiny_imagenet():
     # Download if not exists
     if not zip_path.exists():
         print(f"Downloading Tiny-ImageNet from {url}...")
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get("content-length", 0))
-
-        with open(zip_path, "wb") as f:
-            with tqdm(total=total_size, unit="B", unit_scale=True) as pbar:
-                for data in response.iter_content(chunk_size=1024):
-                    f.write(data)
-                    pbar.update(len(data))
+        download_file(url, zip_path)
 
     # Extract if needed
     if not source_path.exists():
         print("Extracting zip file...")
-        import zipfile
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(base_path / "raw_data")
-            # Rename extracted directory
-            (base_path / "raw_data" / "tiny-imagenet-200").rename(source_path)
+        extract_zip(zip_path, base_path / "raw_data")
+        # Rename extracted directory
+        (base_path / "raw_data" / "tiny-imagenet-200").rename(source_path)
 
 
 def prepare_selected_classes():
@@ -69,12 +58,18 @@ def prepare_selected_classes():
 
         # Copy and rename images
         print(f"Processing {class_name}...")
-        for idx, img_file in enumerate(source_class_dir.glob("*.JPEG")):
+        # Sort so each source image maps to the same target name on every run
+        for idx, img_file in enumerate(sorted(source_class_dir.glob("*.JPEG"))):
             try:
-                # Open and save as JPG with Pillow to ensure compatibility
-                img = Image.open(img_file)
+                # Source files are already JPEGs, so link (or copy) them
+                # instead of decoding and re-encoding with Pillow
                 target_file = class_dir / f"{class_name}_{idx:04d}.jpg"
-                img.save(target_file, "JPEG")
+                if target_file.exists():
+                    continue
+                try:
+                    os.link(img_file, target_file)
+                except OSError:
+                    shutil.copyfile(img_file, target_file)
             except Exception as e:
                 print(f"Error processing {img_file}: {e}")
 
@@ -1,17 +1,36 @@
 import os
-import json
+import orjson
 import shutil
 from pathlib import Path
 from tqdm import tqdm
 from PIL import Image
-import urllib.request
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import dlib
 import face_recognition
 import numpy as np
 
+from utils import download_file
+
 base_path = Path(__file__).parent.parent / "datasets"
 source_path = base_path / "raw_data" / "coco"
 data_path = base_path / "data" / "person_detection"
+person_split_path = source_path / "person_split.npz"
+
+# Number of candidate images decoded and face-checked together
+BATCH_SIZE = 64
+
+
+def fetch_archive(url, zip_path, extracted_path):
+    """Download a COCO archive if needed, then extract it into source_path"""
+    if not zip_path.exists():
+        print(f"Downloading {zip_path.name}...")
+        download_file(url, zip_path)
+
+    if not extracted_path.exists():
+        print(f"Extracting {zip_path.name}...")
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(source_path)
 
 
 def download_coco_subset():
@@ -23,49 +42,112 @@ def download_coco_subset():
     val_images_url = "http://images.cocodataset.org/zips/val2017.zip"
     val_annot_url = "http://images.cocodataset.org/annotations/annotations_trainval2017.zip"
     
-    # Download images if needed
-    image_zip = source_path / "val2017.zip"
-    if not image_zip.exists():
-        print("Downloading COCO validation images...")
-        urllib.request.urlretrieve(val_images_url, image_zip)
-        
-    # Download annotations if needed
-    annot_zip = source_path / "annotations.zip"
-    if not annot_zip.exists():
-        print("Downloading COCO annotations...")
-        urllib.request.urlretrieve(val_annot_url, annot_zip)
-        
-    # Extract files if needed
-    if not (source_path / "val2017").exists():
-        print("Extracting images...")
-        with zipfile.ZipFile(image_zip, 'r') as zip_ref:
-            zip_ref.extractall(source_path)
-            
-    if not (source_path / "annotations").exists():
-        print("Extracting annotations...")
-        with zipfile.ZipFile(annot_zip, 'r') as zip_ref:
-            zip_ref.extractall(source_path)
+    # Each archive is downloaded and then extracted in its own worker, so the
+    # (small) annotations archive is extracted while the images still download
+    archives = [
+        (val_images_url, source_path / "val2017.zip", source_path / "val2017"),
+        (val_annot_url, source_path / "annotations.zip", source_path / "annotations"),
+    ]
+    with ThreadPoolExecutor(max_workers=len(archives)) as executor:
+        futures = [
+            executor.submit(fetch_archive, url, zip_path, extracted_path)
+            for url, zip_path, extracted_path in archives
+        ]
+        for future in futures:
+            future.result()
 
 
-def prepare_person_classes():
-    """Prepare person and no-person classes from COCO dataset"""
-    # Define our target classes
-    target_classes = {
-        "person": 1,      # Images containing people's faces
-        "without_person": 0    # Images without people
-    }
-    
-    # Number of images to use per class
-    images_per_class = 500
+def load_and_crop(src_file):
+    """Open an image as RGB and resize/center crop it to 640x640"""
+    try:
+        # Open and convert image, letting libjpeg decode at a reduced
+        # scale when the source is much larger than the 640x640 target
+        img = Image.open(src_file)
+        img.draft("RGB", (640, 640))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Calculate dimensions for center crop
+        width, height = img.size
+        # Take the larger dimension and use it to resize while maintaining aspect ratio
+        if width > height:
+            new_height = 640
+            new_width = int(width * (640 / height))
+        else:
+            new_width = 640
+            new_height = int(height * (640 / width))
+
+        # Center crop to 640x640, expressed as a box in source pixels so the
+        # crop and resize happen in a single pass without an intermediate image
+        scale = 640 / min(width, height)
+        left = (new_width - 640) // 2 / scale
+        top = (new_height - 640) // 2 / scale
+        right = left + 640 / scale
+        bottom = top + 640 / scale
+
+        # Resize image, reducing by an integer factor first for large downscales
+        return img.resize(
+            (640, 640),
+            Image.Resampling.LANCZOS,
+            box=(left, top, right, bottom),
+            reducing_gap=2.0,
+        )
+
+    except Exception as e:
+        print(f"Error processing {src_file}: {e}")
+        return None
+
+
+def detect_faces(images):
+    """Return the face locations found in each (same sized) image
+
+    Uses dlib's CNN detector on batches of images when dlib was built with
+    CUDA, and falls back to the per-image HOG detector on CPU.
+    """
+    # Convert PIL images to numpy arrays for face_recognition, viewing the raw
+    # RGB bytes directly instead of going through PIL's array interface
+    img_arrays = [
+        np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(img.height, img.width, 3)
+        for img in images
+    ]
+    if not img_arrays:
+        return []
+    if dlib.DLIB_USE_CUDA:
+        # The images are already cropped and resized to 640x640, so the CNN
+        # detector runs on them as-is rather than on a 2x upsampled copy
+        return face_recognition.batch_face_locations(
+            img_arrays, number_of_times_to_upsample=0, batch_size=32
+        )
+    return [face_recognition.face_locations(img_array) for img_array in img_arrays]
 
-    # Download dataset if needed
-    if not source_path.exists():
-        download_coco_subset()
+
+def save_image(img, target_file):
+    """Save an image as a baseline 4:2:0 JPEG"""
+    img.save(
+        target_file, "JPEG", quality=90, subsampling=2, progressive=False, optimize=False
+    )
+
+
+def load_person_split():
+    """Split COCO images into those with and without people
+
+    Returns (id_to_file, person_images, no_person_images). The result is cached
+    next to the annotations and reused as long as the annotations file's mtime
+    matches, which skips parsing the annotations JSON on reruns.
+    """
+    annotations_file = source_path / "annotations" / "instances_val2017.json"
+    annotations_mtime = annotations_file.stat().st_mtime
+    if person_split_path.exists():
+        with np.load(person_split_path) as cache:
+            if cache["mtime"] == annotations_mtime:
+                print("Loading cached COCO person split...")
+                id_to_file = dict(zip(cache["ids"].tolist(), cache["files"].tolist()))
+                return id_to_file, cache["person"], cache["no_person"]
 
     # Load COCO annotations
     print("Loading COCO annotations...")
-    with open(source_path / "annotations" / "instances_val2017.json", 'r') as f:
-        coco = json.load(f)
+    with open(annotations_file, 'rb') as f:
+        coco = orjson.loads(f.read())
     
     # Create image id to filename mapping
     id_to_file = {img['id']: img['file_name'] for img in coco['images']}
@@ -81,76 +163,96 @@ def prepare_person_classes():
         raise ValueError("Could not find person category in COCO dataset")
     
     # Find images with and without people
-    person_images = set()
-    for ann in coco['annotations']:
-        if ann['category_id'] == person_cat_id:
-            person_images.add(ann['image_id'])
-    
-    all_image_ids = {img['id'] for img in coco['images']}
-    no_person_images = all_image_ids - person_images
+    annotations = coco['annotations']
+    ann_image_ids = np.fromiter(
+        (ann['image_id'] for ann in annotations), dtype=np.int64, count=len(annotations)
+    )
+    ann_category_ids = np.fromiter(
+        (ann['category_id'] for ann in annotations), dtype=np.int64, count=len(annotations)
+    )
+    person_images = np.unique(ann_image_ids[ann_category_ids == person_cat_id])
+
+    all_image_ids = np.fromiter(
+        (img['id'] for img in coco['images']), dtype=np.int64, count=len(coco['images'])
+    )
+    no_person_images = np.setdiff1d(all_image_ids, person_images, assume_unique=True)
+
+    np.savez(
+        person_split_path,
+        ids=np.array(list(id_to_file.keys()), dtype=np.int64),
+        files=np.array(list(id_to_file.values())),
+        person=person_images,
+        no_person=no_person_images,
+        mtime=annotations_mtime,
+    )
+    return id_to_file, person_images, no_person_images
+
+
+def prepare_person_classes():
+    """Prepare person and no-person classes from COCO dataset"""
+    # Define our target classes
+    target_classes = {
+        "person": 1,      # Images containing people's faces
+        "without_person": 0    # Images without people
+    }
     
+    # Number of images to use per class
+    images_per_class = 500
+
+    # Download dataset if needed
+    if not source_path.exists():
+        download_coco_subset()
+
+    id_to_file, person_images, no_person_images = load_person_split()
+
     # Process each class
     print("Organizing classes...")
     for class_name in target_classes.keys():
         # Create class directory
         class_dir = data_path / class_name
         class_dir.mkdir(parents=True, exist_ok=True)
-        
+
+        # Skip classes that a previous run already finished. Which source
+        # produced each output depends on face detection, so a partially
+        # written class is regenerated from the start.
+        last_target = class_dir / f"{class_name}_{images_per_class - 1:04d}.jpg"
+        if last_target.exists():
+            print(f"Skipping {class_name}, already prepared")
+            continue
+
         # Select source images
-        source_images = list(person_images if class_name == "person" else no_person_images)
+        source_images = (person_images if class_name == "person" else no_person_images).tolist()
         
-        # Process images
+        # Process images in batches: decode and crop on a thread pool, detect
+        # faces for the whole batch at once, then save the images we keep
         print(f"Processing {class_name}...")
         processed_count = 0
-        for idx, img_id in enumerate(tqdm(source_images)):
-            if processed_count >= images_per_class:
-                break
-                
-            try:
-                # Source and target paths
-                src_file = source_path / "val2017" / id_to_file[img_id]
-                target_file = class_dir / f"{class_name}_{processed_count:04d}.jpg"
-                
-                # Open and convert image
-                img = Image.open(src_file)
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # For person class, check if image contains a face
+        with ThreadPoolExecutor() as executor, tqdm(total=images_per_class) as pbar:
+            for batch_start in range(0, len(source_images), BATCH_SIZE):
+                if processed_count >= images_per_class:
+                    break
+
+                batch_files = [
+                    source_path / "val2017" / id_to_file[img_id]
+                    for img_id in source_images[batch_start : batch_start + BATCH_SIZE]
+                ]
+                images = [
+                    img for img in executor.map(load_and_crop, batch_files) if img is not None
+                ]
+
+                # For person class, keep only images that contain a face
                 if class_name == "person":
-                    # Convert PIL image to numpy array for face_recognition
-                    img_array = np.array(img)
-                    # Detect faces in the image
-                    face_locations = face_recognition.face_locations(img_array)
-                    if not face_locations:  # Skip if no face detected
-                        continue
-                
-                # Calculate dimensions for center crop
-                width, height = img.size
-                # Take the larger dimension and use it to resize while maintaining aspect ratio
-                if width > height:
-                    new_height = 640
-                    new_width = int(width * (640 / height))
-                else:
-                    new_width = 640
-                    new_height = int(height * (640 / width))
-                
-                # Resize image
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Center crop to 640x640
-                left = (new_width - 640) // 2
-                top = (new_height - 640) // 2
-                right = left + 640
-                bottom = top + 640
-                img = img.crop((left, top, right, bottom))
-                
-                # Save with high quality
-                img.save(target_file, "JPEG", quality=95)
-                processed_count += 1
-                
-            except Exception as e:
-                print(f"Error processing {src_file}: {e}")
+                    face_locations = detect_faces(images)
+                    images = [img for img, faces in zip(images, face_locations) if faces]
+
+                images = images[: images_per_class - processed_count]
+                target_files = [
+                    class_dir / f"{class_name}_{processed_count + i:04d}.jpg"
+                    for i in range(len(images))
+                ]
+                list(executor.map(save_image, images, target_files))
+                processed_count += len(images)
+                pbar.update(len(images))
 
 
 if __name__ == "__main__":
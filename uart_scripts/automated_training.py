@@ -1,12 +1,17 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import itertools
+import os
 from pathlib import Path
 import random
+import selectors
 import sys
 import threading
 import time
 import json
-from typing import List, Optional, Set, Tuple
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
 import metrics
-import cv2
 import numpy as np
 import tqdm
 
@@ -17,61 +22,303 @@ from utils import (
     find_stm32_port,
     create_serial_connection,
     PROJECT_ROOT,
+    raise_thread_priority,
+    reset_thread_priority,
     select_dataset,
     update_output_ch_file,
     smart_build_and_deploy,
 )
 
 SCREEN_WIDTH, SCREEN_HEIGHT = 469, 387
+# Number of images decoded ahead of the one currently on screen
+PREFETCH_DEPTH = 2
+# Largest scaled frame: 80% of the display, 3 bytes per pixel (~0.35 MB)
+MAX_FRAME_BYTES = int(SCREEN_WIDTH * 0.8) * int(SCREEN_HEIGHT * 0.8) * 3
+# Memory the frame cache may use, and the number of scaled images that fits
+FRAME_CACHE_BYTES = 512 << 20
+FRAME_CACHE_SIZE = FRAME_CACHE_BYTES // MAX_FRAME_BYTES
+# Memory spent decoding frames up front, before training starts
+PRELOAD_BYTES = 256 << 20
+# Number of recent UART messages kept by UARTHandler; comfortably more than
+# the device logs between two commands
+MESSAGE_BUFFER_SIZE = 256
+# Number of parsed inference/prediction results kept by UARTHandler
+RESULT_BUFFER_SIZE = 16
+# Cap on OpenCV's worker threads so decoding doesn't crowd out UART handling
+OPENCV_THREADS = 2
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png"})
+# Files caching each dataset's class directory listings, kept outside the
+# (git-tracked) dataset tree
+MANIFEST_DIR = PROJECT_ROOT / ".cache" / "manifests"
+# Device log lines the training loop reacts to; others are dropped undecoded
+RELEVANT_MESSAGE_PREFIXES = (b"COMMAND RECEIVED", b"TRAINING", b"INFERENCE COMPLETE")
+# Frames are centered on this black background just before being shown
+_CANVAS = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+# (x, y, width, height) of the frame last pasted onto _CANVAS
+_canvas_rect = (0, 0, 0, 0)
+# cv2.imread flags per class directory, picked from its first image so the
+# rest decode at reduced size
+_READ_FLAGS: Dict[str, int] = {}
+
+@functools.lru_cache(maxsize=None)
+def load_manifest(dataset_path: str) -> dict:
+    """Load the dataset's cached class listings ({} if there are none)
+
+    The manifest maps each class name to the mtime of its directory and the
+    sorted image file names in it. Delete it to force a rescan.
+    """
+    try:
+        return json.loads(manifest_path(dataset_path).read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_path(dataset_path: str) -> Path:
+    """Return where the manifest for dataset_path is stored"""
+    return MANIFEST_DIR / f"{os.path.basename(os.path.normpath(dataset_path))}.json"
+
+
+@functools.lru_cache(maxsize=None)
+def load_class_images(dataset_path: str, class_name: str) -> Tuple[str, ...]:
+    """Load all images for a specific class
+
+    The listing is cached per class directory; copy it before mutating. It is
+    sorted, since directory order varies between filesystems and would make
+    seeded splits differ from machine to machine. Listings are also kept in
+    the dataset's manifest, so a class directory is only rescanned once its
+    mtime changes (i.e. files were added, removed or renamed).
+    """
+    class_path = os.path.join(dataset_path, class_name)
+    mtime = os.stat(class_path).st_mtime_ns
+    manifest = load_manifest(dataset_path)
+    entry = manifest.get(class_name)
+    if entry is None or entry["mtime"] != mtime:
+        with os.scandir(class_path) as entries:
+            names = sorted(
+                entry.name
+                for entry in entries
+                if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+                and entry.is_file()
+            )
+        manifest[class_name] = entry = {"mtime": mtime, "images": names}
+        try:
+            MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+            manifest_path(dataset_path).write_text(json.dumps(manifest))
+        except OSError:
+            pass  # can't write the cache; just rescan next time
+
+    return tuple(os.path.join(class_path, name) for name in entry["images"])
+
+
+@functools.lru_cache(maxsize=None)
+def frame_layout(width: int, height: int) -> Tuple[float, int, int]:
+    """Return (scale, new_width, new_height) to fit an image on the display
+
+    Datasets come in a handful of sizes, so this is worked out once per size.
+    """
+    scale = min(SCREEN_WIDTH / width, SCREEN_HEIGHT / height) * 0.8
+    return scale, int(width * scale), int(height * scale)
+
+
+@functools.lru_cache(maxsize=None)
+def reduced_read_flag(width: int, height: int) -> int:
+    """Return the cv2.imread flag that decodes an image of this size at the
+    smallest reduction still at least as large as its display size"""
+    import cv2
 
-def load_class_images(dataset_path: str, class_name: str) -> List[str]:
-    """Load all images for a specific class"""
-    class_path = Path(dataset_path) / class_name
-    return [
-        str(f)
-        for f in class_path.glob("*")
-        if f.suffix.lower() in [".jpg", ".jpeg", ".png"]
-    ]
+    _, new_width, new_height = frame_layout(width, height)
+    for factor, flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if width // factor >= new_width and height // factor >= new_height:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def load_frame(image_path: str) -> np.ndarray:
+    """Load image scaled to fit the display, ready for show_frame
+
+    Frames are cached per path, since the same images are shown in every
+    epoch and validation pass. The returned array is read-only.
+    """
+    import cv2
+
+    class_path = os.path.dirname(image_path)
+    img = cv2.imread(image_path, _READ_FLAGS.get(class_path, cv2.IMREAD_COLOR))
+    if img is None:
+        raise ValueError(f"Could not load image: {image_path}")
+    if class_path not in _READ_FLAGS:
+        _READ_FLAGS[class_path] = reduced_read_flag(img.shape[1], img.shape[0])
+
+    # Resize image while maintaining aspect ratio
+    scale, new_width, new_height = frame_layout(img.shape[1], img.shape[0])
+    if (new_width, new_height) == (img.shape[1], img.shape[0]):
+        img_resized = img
+    else:
+        # INTER_AREA is both faster and alias-free when shrinking
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        img_resized = cv2.resize(
+            img, (new_width, new_height), interpolation=interpolation
+        )
+
+    img_resized.flags.writeable = False
+    return img_resized
+
+
+def poll_window_events():
+    """Handle pending window events without waiting for a key"""
+    import cv2
+
+    # pollKey (OpenCV >= 4.5) returns immediately; waitKey(1) blocks >= 1 ms
+    if hasattr(cv2, "pollKey"):
+        cv2.pollKey()
+    else:
+        cv2.waitKey(1)
+
+
+def show_frame(
+    frame: np.ndarray, window_name: str = "Training Image", delay: float = 0.5
+):
+    """Show a frame produced by load_frame and wait for it to settle
+
+    The device grabs a camera frame as soon as it receives a command, so the
+    settle delay can't overlap with send_command. Instead of sleeping through
+    it, keep servicing the window so the new frame is actually presented early
+    in the delay rather than whenever the GUI backend next gets a turn.
+    """
+    global _canvas_rect
+    import cv2
+
+    settled_at = time.monotonic() + delay
+    # Center the frame on the shared background; imshow copies it. Only the
+    # previous frame's area needs clearing, and only if this one won't cover it
+    height, width = frame.shape[:2]
+    x_offset = (SCREEN_WIDTH - width) // 2
+    y_offset = (SCREEN_HEIGHT - height) // 2
+    rect = (x_offset, y_offset, width, height)
+    if rect != _canvas_rect:
+        prev_x, prev_y, prev_width, prev_height = _canvas_rect
+        _CANVAS[prev_y : prev_y + prev_height, prev_x : prev_x + prev_width] = 0
+        _canvas_rect = rect
+    _CANVAS[y_offset : y_offset + height, x_offset : x_offset + width] = frame
+    cv2.imshow(window_name, _CANVAS)
+    if delay <= 0:
+        poll_window_events()
+        return
+    while True:
+        remaining = settled_at - time.monotonic()
+        if remaining <= 0:
+            break
+        cv2.waitKey(max(1, min(int(remaining * 1000), 50)))
 
 
 def display_image(
     image_path: str, window_name: str = "Training Image", delay: float = 0.5
 ):
     """Display image centered on black background"""
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Could not load image: {image_path}")
+    show_frame(load_frame(image_path), window_name, delay)
 
-    # Create black background
-    screen_width, screen_height = SCREEN_WIDTH, SCREEN_HEIGHT  # Adjustable
-    background = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
 
-    # Resize image while maintaining aspect ratio
-    scale = min(screen_width / img.shape[1], screen_height / img.shape[0]) * 0.8
-    new_width = int(img.shape[1] * scale)
-    new_height = int(img.shape[0] * scale)
-    img_resized = cv2.resize(img, (new_width, new_height))
-
-    # Calculate position to center image
-    x_offset = (screen_width - new_width) // 2
-    y_offset = (screen_height - new_height) // 2
-
-    # Place image on background
-    background[y_offset : y_offset + new_height, x_offset : x_offset + new_width] = (
-        img_resized
+def prefetch_frames(
+    image_paths: List[str], depth: int = PREFETCH_DEPTH
+) -> Iterator[np.ndarray]:
+    """Return an iterator over frames for image_paths, loading ahead
+
+    Frames are decoded and scaled on a background thread (cv2 releases the
+    GIL), so the next image is ready by the time the device finishes with the
+    current one. The first `depth + 1` frames start loading immediately,
+    before the iterator is consumed.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, initializer=reset_thread_priority)
+    remaining_paths = iter(image_paths)
+    pending: Deque[Future] = deque(
+        executor.submit(load_frame, image_path)
+        for image_path in itertools.islice(remaining_paths, depth + 1)
     )
 
-    cv2.imshow(window_name, background)
-    cv2.waitKey(1)
+    def frames() -> Iterator[np.ndarray]:
+        try:
+            while pending:
+                frame = pending.popleft().result()
+                for image_path in itertools.islice(remaining_paths, 1):
+                    pending.append(executor.submit(load_frame, image_path))
+                yield frame
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    time.sleep(delay)  # Small delay to ensure display is complete
+    return frames()
 
 
-def display_blank_frame(window_name: str = "Training Image"):
-    """Display blank white frame for camera alignment"""
+def warm_page_cache(image_paths: List[str]):
+    """Ask the OS to read image_paths into its page cache ahead of use"""
+    for image_path in image_paths:
+        try:
+            fd = os.open(image_path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                # No readahead hint (e.g. macOS), so read the file instead
+                while os.read(fd, 1 << 20):
+                    pass
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def preload_frames(image_paths: List[str]):
+    """Decode image_paths into the frame cache ahead of use
+
+    Decoding runs on one thread per core (cv2 releases the GIL). Only as many
+    frames as fit in the cache and in PRELOAD_BYTES are decoded; the remaining
+    paths are just read into the page cache.
+    """
+    preload_count = min(
+        len(image_paths), FRAME_CACHE_SIZE, PRELOAD_BYTES // MAX_FRAME_BYTES
+    )
+
+    def preload(image_path: str):
+        try:
+            load_frame(image_path)
+        except ValueError:
+            pass  # reported again when the image is shown
+
+    with ThreadPoolExecutor(
+        max_workers=os.cpu_count(), initializer=reset_thread_priority
+    ) as executor:
+        # Iterate the results so unexpected errors are not silently dropped
+        for _ in executor.map(preload, image_paths[:preload_count]):
+            pass
+    warm_page_cache(image_paths[preload_count:])
+
+
+def reduce_scheduling_jitter():
+    """Cap OpenCV's thread pool and raise the main thread's scheduling priority
+
+    UART handling runs on the main thread. Frame decoding threads started
+    after this (and the OpenCV threads they start) reset themselves to normal
+    priority, so they can't starve it.
+    """
+    import cv2
+
+    cv2.setNumThreads(OPENCV_THREADS)
+    raise_thread_priority()
+
+
+@functools.lru_cache(maxsize=1)
+def alignment_frame() -> np.ndarray:
+    """Render the white camera alignment frame (once; the result is read-only)"""
+    import cv2
+
     screen_width, screen_height = SCREEN_WIDTH, SCREEN_HEIGHT  # Same as in display_image
     # Create white background
-    background = np.ones((screen_height, screen_width, 3), dtype=np.uint8) * 255
+    background = np.full((screen_height, screen_width, 3), 255, dtype=np.uint8)
 
     # Add alignment text
     font = cv2.FONT_HERSHEY_SIMPLEX
@@ -81,8 +328,26 @@ def display_blank_frame(window_name: str = "Training Image"):
     text_y = screen_height // 2
     cv2.putText(background, text, (text_x, text_y), font, 1, (0, 0, 0), 2)
 
-    cv2.imshow(window_name, background)
-    cv2.waitKey(1)
+    background.flags.writeable = False
+    return background
+
+
+def display_blank_frame(window_name: str = "Training Image"):
+    """Display blank white frame for camera alignment"""
+    import cv2
+
+    cv2.imshow(window_name, alignment_frame())
+    poll_window_events()
+
+
+def create_window(window_name: str = "Training Image"):
+    """Create the display window once, sized to the frames and kept on top"""
+    import cv2
+
+    cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+    cv2.resizeWindow(window_name, SCREEN_WIDTH, SCREEN_HEIGHT)
+    if hasattr(cv2, "WND_PROP_TOPMOST"):
+        cv2.setWindowProperty(window_name, cv2.WND_PROP_TOPMOST, 1)
 
 
 class UARTHandler:
@@ -97,106 +362,171 @@ class UARTHandler:
         print(f"Connected to STM32 on port {self.port}")
         self.ser = create_serial_connection(self.port)
         print(f"Connected to STM32 on port {self.port}")
-        self.last_messages = []
-        self.message_received = threading.Event()
-
-        # Start reading thread
-        self.running = True
-        self.read_thread = threading.Thread(target=self._read_serial, daemon=True)
-        self.read_thread.start()
+        self.last_messages: Deque[str] = deque(maxlen=MESSAGE_BUFFER_SIZE)
+        # Class numbers parsed from result lines as they arrive
+        self.inference_results: Deque[int] = deque(maxlen=RESULT_BUFFER_SIZE)
+        self.training_predictions: Deque[int] = deque(maxlen=RESULT_BUFFER_SIZE)
+        self.rx_buffer = bytearray()
+
+        # Serial input is read on demand from the calling thread: waiters
+        # block on the port's file descriptor instead of a reader thread
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.ser.fd, selectors.EVENT_READ)
         print("UART handler initialized successfully")
 
-    def _read_serial(self):
-        while self.running:
-            if self.ser.in_waiting:
-                try:
-                    line = self.ser.readline().decode("utf-8").strip()
-                    if line:
-                        if self.DEBUG_RECEIVED_MESSAGES:
-                            print(f"Received: {line}")
-                        self.last_messages.append(line)
-                        self.message_received.set()
-                except Exception as e:
-                    print(f"Error reading serial: {e}")
-            time.sleep(0.01)
-
-    def send_command(self, cmd: str):
+    def _read_serial(self, timeout: float) -> List[str]:
+        """Wait up to `timeout` seconds for serial input and return new lines
+
+        Everything already buffered by the OS is drained in one read and split
+        into lines; a trailing partial line is kept until its newline arrives.
+        """
+        if not self.selector.select(timeout):
+            return []
+
+        try:
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+        except Exception as e:
+            print(f"Error reading serial: {e}")
+            return []
+        if b"\n" not in chunk:
+            self.rx_buffer += chunk
+            return []
+
+        *raw_lines, self.rx_buffer = (self.rx_buffer + chunk).split(b"\n")
+        lines = []
+        for raw_line in raw_lines:
+            if not (
+                self.DEBUG_RECEIVED_MESSAGES
+                or raw_line.startswith(RELEVANT_MESSAGE_PREFIXES)
+            ):
+                continue
+            # The firmware only logs ASCII; line noise becomes U+FFFD
+            line = raw_line.decode("ascii", "replace").strip()
+            if line:
+                if self.DEBUG_RECEIVED_MESSAGES:
+                    print(f"Received: {line}")
+                lines.append(line)
+                if line.startswith("INFERENCE COMPLETE:"):
+                    self._record_result(self.inference_results, line)
+                elif line.startswith("TRAINING PREDICTION:"):
+                    self._record_result(self.training_predictions, line)
+
+        self.last_messages.extend(lines)
+        return lines
+
+    @staticmethod
+    def _record_result(results: Deque[int], line: str):
+        try:
+            results.append(int(line.rsplit(":", 1)[1]))
+        except ValueError:
+            pass
+
+    def get_messages(self) -> List[str]:
+        """Return the buffered messages"""
+        return list(self.last_messages)
+
+    def clear_messages(self):
+        # Drain input that is already waiting so it isn't mistaken for a
+        # response to whatever happens next
+        while self._read_serial(0):
+            pass
+        self.last_messages.clear()
+        self.inference_results.clear()
+        self.training_predictions.clear()
+
+    def send_command(self, cmd: str, log: bool = True):
         # Clear any old messages before sending new command
-        self.last_messages = []
-        self.message_received.clear()
+        self.clear_messages()
 
         self.ser.write(cmd.encode())
-        print(f"Sent command: {cmd}")
+        if log:
+            print(f"Sent command: {cmd}")
         # wait to receive "COMMAND RECEIVED: <cmd>"
         if not self.wait_for_message(f"COMMAND RECEIVED: {cmd}"):
             raise TimeoutError(f"Failed to receive command: {cmd}")
-        # sleep 0.1s to allow for command to be processed
-        time.sleep(0.1)
 
     def wait_for_message(self, expected_msg: str, timeout: float = 10.0) -> bool:
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            # Check new messages
-            for msg in self.last_messages:
-                if expected_msg in msg:
-                    return True
-
-            # Wait for new messages
-            self.message_received.wait(timeout=0.1)
-            self.message_received.clear()
-
-        return False
+        """Wait for a line starting with expected_msg (device logs are line-prefixed)"""
+        deadline = time.monotonic() + timeout
+        # Check every buffered message once, then only new arrivals
+        new_messages = self.get_messages()
+        while True:
+            if any(msg.startswith(expected_msg) for msg in new_messages):
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            new_messages = self._read_serial(remaining)
 
     def wait_for_consecutive_inference(
         self, num_consecutive: int = 3, timeout: float = 10.0
     ) -> int:
         """Wait for N consecutive identical inference results"""
-        start_time = time.time()
-        results = []
-
-        while time.time() - start_time < timeout:
-            if self.message_received.wait(timeout=0.1):
-                self.message_received.clear()
-                for msg in self.last_messages[-5:]:
-                    if "INFERENCE COMPLETE:" in msg:
-                        try:
-                            class_num = int(msg.split(":")[-1].strip())
-                            results.append(class_num)
-                            if len(results) >= num_consecutive:
-                                if len(set(results[-num_consecutive:])) == 1:
-                                    return results[-1]
-                        except ValueError:
-                            continue
+        deadline = time.monotonic() + timeout
+        results = self.inference_results
+        while True:
+            if len(results) >= num_consecutive:
+                latest = results[-1]
+                recent = itertools.islice(reversed(results), num_consecutive)
+                if all(class_num == latest for class_num in recent):
+                    return latest
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._read_serial(remaining)
 
         raise TimeoutError("Failed to get consecutive inference results")
 
     def close(self):
-        self.running = False
-        if self.read_thread.is_alive():
-            self.read_thread.join()
+        self.selector.close()
         self.ser.close()
 
+
+def load_dataset_images(
+    dataset_path: str,
+    class_names: List[str],
+    max_examples_per_class: Optional[int] = None,
+) -> List[Tuple[str, ...]]:
+    """Return the image paths of every class, indexed by class number
+
+    Listings are complete; each split applies max_examples_per_class itself.
+    """
+    images_by_class = []
+    for class_name in class_names:
+        images = load_class_images(dataset_path, class_name)
+        num_images = len(images)
+        if max_examples_per_class:
+            num_images = min(num_images, max_examples_per_class)
+        print(f"Loaded {num_images} images for class '{class_name}'")
+        images_by_class.append(images)
+    return images_by_class
+
+
 def random_split_dataset(
     dataset_path: str,
     class_names: List[str],
     max_examples_per_class: Optional[int] = None,
     exclude_classes: Optional[Set[int]] = None,
 ) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
-    class_to_idx = {name: idx for idx, name in enumerate(class_names)}
-    all_data = []
+    paths: List[str] = []
+    labels: List[int] = []
 
-    for class_name in class_names:
-        images = load_class_images(dataset_path, class_name)
+    images_by_class = load_dataset_images(
+        dataset_path, class_names, max_examples_per_class
+    )
+    for class_idx, images in enumerate(images_by_class):
         if max_examples_per_class:
             images = images[:max_examples_per_class]
-        all_data.extend([(img, class_to_idx[class_name]) for img in images])
-        print(f"Loaded {len(images)} images for class '{class_name}'")
-
-    if exclude_classes:
-        all_data = [data for data in all_data if data[1] not in exclude_classes]
+        if exclude_classes and class_idx in exclude_classes:
+            continue
+        paths.extend(images)
+        labels.extend([class_idx] * len(images))
 
     # Split data
-    random.shuffle(all_data)
+    order = np.random.permutation(len(paths)).tolist()
+    all_data = [(paths[i], labels[i]) for i in order]
     train_split = 0.7
     train_size = int(len(all_data) * train_split)
 
@@ -210,17 +540,18 @@ def sequential_split_dataset(
     exclude_classes: Optional[Set[int]] = None,
 ) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
     """Prepare and split dataset into training and validation sets"""
-    class_to_idx = {name: idx for idx, name in enumerate(class_names)}
     all_class_labels: List[List[Tuple[str, int]]] = []
     min_labels_per_class = 1_000_000
 
-    for class_name in class_names:
-        images = load_class_images(dataset_path, class_name)
-        random.shuffle(images)
+    images_by_class = load_dataset_images(
+        dataset_path, class_names, max_examples_per_class
+    )
+    for class_idx, images in enumerate(images_by_class):
+        num_images = len(images)
         if max_examples_per_class:
-            images = images[:max_examples_per_class]
-        all_class_labels.append([(img, class_to_idx[class_name]) for img in images])
-        print(f"Loaded {len(images)} images for class '{class_name}'")
+            num_images = min(num_images, max_examples_per_class)
+        images = random.sample(images, num_images)
+        all_class_labels.append([(img, class_idx) for img in images])
         min_labels_per_class = min(min_labels_per_class, len(images))
 
     if exclude_classes:
@@ -231,27 +562,31 @@ def sequential_split_dataset(
             if class_labels_array[0][1] not in exclude_classes
         ]
 
-    training_data: List[Tuple[str, int]] = []
-    test_data: List[Tuple[str, int]] = []
-
     train_split = 0.7
     num_training_samples = int(min_labels_per_class * train_split)
 
-    for i in range(min_labels_per_class):
-        for class_labels_array in all_class_labels:
-            # Add to training data if index is less than number of training samples
-            if i < num_training_samples:
-                training_data.append(class_labels_array.pop(0))
-            else:
-                test_data.append(class_labels_array.pop(0))
+    # Interleave the classes (one sample of each class in turn), then put the
+    # first num_training_samples rounds in training and the rest in test
+    interleaved: List[Tuple[str, int]] = list(
+        itertools.chain.from_iterable(
+            zip(
+                *(
+                    class_labels_array[:min_labels_per_class]
+                    for class_labels_array in all_class_labels
+                )
+            )
+        )
+    )
+    split = num_training_samples * len(all_class_labels)
 
-    return training_data, test_data
+    return interleaved[:split], interleaved[split:]
 
 
 def run_validation(
     uart: UARTHandler, val_data: List[Tuple[str, int]], 
     metrics_tracker: metrics.MetricsTracker,
     phase: str = "Validation",
+    display: bool = True,
 ) -> Tuple[float, dict]:
     """Run validation and print detailed metrics
 
@@ -259,20 +594,28 @@ def run_validation(
         uart: UART handler for device communication
         val_data: List of (image_path, class) tuples
         phase: Description of validation phase (e.g., "Initial", "Final", etc.)
+        display: If False, don't load or show the images
 
     Returns:
         metrics: Dictionary containing validation metrics (class accuracies, image paths, predictions, etc.)
     """
     print(f"\n=== Running {phase} Validation ===")
+    # Start loading frames while the device switches modes
+    frames = (
+        prefetch_frames([image_path for image_path, _ in val_data])
+        if display
+        else itertools.repeat(None)
+    )
     uart.send_command("v")  # Enter validation mode
 
-    val_start = time.time()
+    val_start = time.monotonic()
     metrics_tracker.val_mode()
 
-    for idx, (image_path, true_class) in tqdm.tqdm(enumerate(val_data), total=len(val_data), ascii=" ▖▘▝▗▚▞█"):
+    for idx, ((image_path, true_class), frame) in tqdm.tqdm(enumerate(zip(val_data, frames)), total=len(val_data), ascii=" ▖▘▝▗▚▞█"):
         # clear uart messages
-        uart.last_messages = []
-        display_image(image_path, delay=1.0)
+        uart.clear_messages()
+        if display:
+            show_frame(frame, delay=1.0)
         #uart.send_image(image_path)
         try:
             predicted_class = uart.wait_for_consecutive_inference(num_consecutive=3)
@@ -280,8 +623,8 @@ def run_validation(
         except TimeoutError:
             print(f"ERROR: Failed to get consistent prediction for {image_path}")
 
-    val_time = time.time() - val_start
-    metrics_tracker.metrics["run_time"] = val_time
+    val_time = time.monotonic() - val_start
+    metrics_tracker.run_time = val_time
     metrics_tracker.print_summary()
     metrics_tracker.save_metrics()
 
@@ -292,6 +635,7 @@ def run_training_epoch(
     uart: UARTHandler, train_data: List[Tuple[str, int]], epoch: int, epochs: int,
     metrics_tracker: metrics.MetricsTracker,
     record_every: int = 10, 
+    display: bool = True,
 ) -> dict:
     """Run a single training epoch and return metrics
 
@@ -301,48 +645,49 @@ def run_training_epoch(
         epoch: Current epoch number
         epochs: Total number of epochs
         record_every: If > 0, save metrics every N steps
+        display: If False, don't load or show the images
 
     Returns:
         metrics: Dictionary containing training metrics (class accuracies, image paths, predictions, etc.)
     """
 
+    # Shuffle training data and start loading frames while the device
+    # switches modes
+    random.shuffle(train_data)
+    frames = (
+        prefetch_frames([image_path for image_path, _ in train_data])
+        if display
+        else itertools.repeat(None)
+    )
+
     uart.send_command("t")  # Enter training mode
 
-    epoch_start = time.time()
+    epoch_start = time.monotonic()
     print(f"\nEpoch {epoch + 1}/{epochs}")
     metrics_tracker.train_mode()
 
-    # Shuffle training data
-    random.shuffle(train_data)
-
-    for idx, (image_path, true_class) in tqdm.tqdm(enumerate(train_data), total=len(train_data), ascii=" ▖▘▝▗▚▞█"):
+    for idx, ((image_path, true_class), frame) in tqdm.tqdm(enumerate(zip(train_data, frames)), total=len(train_data), ascii=" ▖▘▝▗▚▞█"):
         # Initialize class metrics if not exists
-        img_start = time.time()
-        print(f"\nTraining image {idx + 1}/{len(train_data)} (Class: {true_class})")
-        display_image(image_path)
+        img_start = time.monotonic()
+        # Everything about this image is reported in a single write
+        log = f"\nTraining image {idx + 1}/{len(train_data)} (Class: {true_class})"
+        if display:
+            show_frame(frame)
         #uart.send_image(image_path)
         # Send class number and wait for training completion
-        uart.send_command(str(true_class))
+        uart.send_command(str(true_class), log=False)
 
         # Wait for training completion and prediction
         if uart.wait_for_message("TRAINING DONE", timeout=5.0):
-            # Look for prediction in messages
-            predicted_class = None
-            for msg in uart.last_messages:
-                if "TRAINING PREDICTION:" in msg:
-                    try:
-                        predicted_class = int(msg.split(":")[-1].strip())
-                        break
-                    except ValueError:
-                        continue
-
-            if predicted_class is not None:
+            # Prediction for this image (results were cleared by send_command)
+            if uart.training_predictions:
                 # Update metrics
-                metrics_tracker.update(predicted_class, true_class)
+                metrics_tracker.update(uart.training_predictions[0], true_class)
             else:
-                print(f"WARNING: No prediction received for image {idx + 1}")
+                log += f"\nWARNING: No prediction received for image {idx + 1}"
         else:
-            print(f"WARNING: Training timeout for image {idx + 1}")
+            log += f"\nWARNING: Training timeout for image {idx + 1}"
+        print(log)
 
         if record_every > 0 and (idx + 1) % record_every == 0:
             print(f"Saving metrics after {idx + 1} images")
@@ -350,8 +695,8 @@ def run_training_epoch(
             metrics_tracker.save_metrics()
 
     # Calculate final metrics
-    training_time = time.time() - epoch_start
-    metrics_tracker.metrics["run_time"] = training_time
+    training_time = time.monotonic() - epoch_start
+    metrics_tracker.run_time = training_time
 
     metrics_tracker.print_summary()
     metrics_tracker.save_metrics()
@@ -370,6 +715,7 @@ def main(
     preselected_dataset: Optional[str] = None,
     run_name: Optional[str] = "run",
     record_every: int = 10,
+    no_display: bool = False,
 ):
     try:
         if random_seed is not None:
@@ -384,16 +730,10 @@ def main(
 
         # Update OUTPUT_CH.h file
         output_ch_file = str(PROJECT_ROOT / "Src/TinyEngine/include/OUTPUT_CH.h")
-        update_output_ch_file(class_names, output_ch_file)
-        print(f"\nUpdated OUTPUT_CH.h with {len(class_names)} classes")
-
-        # Build and deploy
-        if clean:
-            clean_project()
-            build_project()
-            deploy_binary()
+        if update_output_ch_file(class_names, output_ch_file):
+            print(f"\nUpdated OUTPUT_CH.h with {len(class_names)} classes")
         else:
-            smart_build_and_deploy()  # Use smart build instead
+            print(f"\nOUTPUT_CH.h already up to date with {len(class_names)} classes")
 
         # Prepare dataset with max examples limit and random seed
         train_data, val_data = (
@@ -415,52 +755,82 @@ def main(
             f"\nData split: {len(train_data)} training samples, {len(val_data)} validation samples"
         )
 
+        # Decode the images while the device is flashed, validation images
+        # first since they are shown first
+        if not no_display:
+            threading.Thread(
+                target=preload_frames,
+                args=([image_path for image_path, _ in val_data + train_data],),
+                daemon=True,
+            ).start()
+
+        # Build and deploy
+        if clean:
+            clean_project()
+            build_project()
+            deploy_binary()
+        else:
+            smart_build_and_deploy()  # Use smart build instead
+
         metrics_tracker = metrics.MetricsTracker(num_classes=len(class_names), 
                                                  mode="train",
                                                  model="base",
                                                  run_name=run_name,
                                                  track_predictions=True,
                                                  examples_per_class=max_examples_per_class,
-                                                 random_seed=random_seed)
-        training_start_time = time.time()
+                                                 random_seed=random_seed,
+                                                 writer_initializer=reset_thread_priority)
+        training_start_time = time.monotonic()
+        reduce_scheduling_jitter()
+        if not no_display:
+            create_window()
         uart = UARTHandler()
         try:
             # TODO maybe this should be the first image to better determine camera focus
             # than just black text on white frame
-            if not no_align:
+            if not no_align and not no_display:
                 # Display blank frame and wait for alignment
                 display_blank_frame()
                 input("Position camera and press Enter to start training...")
 
             # Initial validation
             initial_metrics = run_validation(
-                uart, val_data, metrics_tracker, "Initial"
+                uart, val_data, metrics_tracker, "Initial", not no_display
             )
             # Training phase
             print("\n=== Starting Training Phase ===")
 
             for epoch in range(epochs):
-                output_metrics = run_training_epoch(uart, train_data, epoch, epochs, metrics_tracker, record_every)
+                output_metrics = run_training_epoch(uart, train_data, epoch, epochs, metrics_tracker, record_every, not no_display)
 
                 print(f"\nEpoch {epoch + 1} Stats:")
                 print(f"Time: {output_metrics['run_time']:.2f}s")
                 if epoch != epochs - 1:
                     # Mid-training validation
                     val_metrics = run_validation(
-                        uart, val_data, metrics_tracker, f"Epoch {epoch + 1}"
+                        uart, val_data, metrics_tracker, f"Epoch {epoch + 1}",
+                        not no_display,
                     )
 
             # Final validation
             final_metrics = run_validation(
-                uart, val_data, metrics_tracker, "Final"
+                uart, val_data, metrics_tracker, "Final", not no_display
             )
 
-            total_time = time.time() - training_start_time
+            total_time = time.monotonic() - training_start_time
             print(f"\n=== Training Session Completed in {total_time:.2f}s ===")
 
         finally:
-            uart.close()
-            cv2.destroyAllWindows()
+            # Flush first so pending metrics files land even if closing the
+            # port fails
+            try:
+                metrics_tracker.flush()
+            finally:
+                uart.close()
+            if not no_display:
+                import cv2
+
+                cv2.destroyAllWindows()
 
     except Exception as e:
         print(f"Error: {e}")
@@ -529,6 +899,15 @@ if __name__ == "__main__":
         "--run-name", "-rn", type=str, default="run", help="Metrics will be saved in a subdirectory with this name"
     )
 
+    # skip the OpenCV window, e.g. to time the device protocol over SSH
+    parser.add_argument(
+        "--no-display",
+        "-nd",
+        default=False,
+        action="store_true",
+        help="Don't show images (the device trains on whatever its camera sees)",
+    )
+
     args = parser.parse_args()
     exit(
         main(
@@ -543,5 +922,6 @@ if __name__ == "__main__":
             no_align=args.no_align,
             preselected_dataset=args.dataset,
             run_name=args.run_name,
+            no_display=args.no_display,
         )
     )
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import json
 import glob
@@ -8,51 +10,82 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.gridspec import GridSpec
 
+# Processed metrics DataFrames, cached outside the metrics directories
+METRICS_CACHE_DIR = Path(__file__).parent.parent / ".cache" / "metrics"
+
+def metrics_to_dataframe(metrics, experiment_name, num_classes):
+    """Build a DataFrame with one row per metrics file, computing accuracies
+    as whole columns instead of row by row."""
+    count = len(metrics)
+
+    def column(key):
+        return np.fromiter((m[key] for m in metrics), dtype=np.int64, count=count)
+
+    def class_column(key):
+        return np.array(
+            [[m[str(k)][key] for k in range(num_classes)] for m in metrics],
+            dtype=np.int64,
+        ).reshape(count, num_classes)
+
+    total = column('total')
+    class_accs = class_column('true_positives') / np.maximum(class_column('total'), 1)
+    return pd.DataFrame({
+        'step': column('step'),
+        'epoch': column('epoch'),
+        'epoch_steps': total,
+        # Steps with no samples count as 0 accuracy
+        'accuracy': column('true_positives') / np.maximum(total, 1),
+        'experiment': experiment_name,
+        **{f'class_{k}_acc': class_accs[:, k] for k in range(num_classes)},
+    })
+
 def load_experiment_data(experiment_name):
     """Load and process metrics for a single experiment."""
     metrics_path = f'metrics/{experiment_name}/'
     
-    # Load metrics files
-    training_metrics = [json.load(open(os.path.join(metrics_path, f))) 
-                       for f in sorted(os.listdir(metrics_path)) 
-                       if f.startswith("train_") and f.endswith(".json")]
-    validation_metrics = [json.load(open(os.path.join(metrics_path, f))) 
-                         for f in sorted(os.listdir(metrics_path))
-                         if f.startswith("val_") and f.endswith(".json")]
+    # Find metrics files
+    file_names = sorted(f for f in os.listdir(metrics_path) if f.endswith(".json"))
+    training_files = [f for f in file_names if f.startswith("train_")]
+    validation_files = [f for f in file_names if f.startswith("val_")]
+
+    # Reuse the processed DataFrames while no metrics file has changed
+    stats = [os.stat(os.path.join(metrics_path, f)) for f in file_names]
+    experiment_key = hashlib.sha1(os.path.abspath(metrics_path).encode()).hexdigest()[:16]
+    cache_key = hashlib.sha1(repr([
+        (f, st.st_mtime_ns, st.st_size) for f, st in zip(file_names, stats)
+    ]).encode()).hexdigest()[:16]
+    cache_path = METRICS_CACHE_DIR / f'{experiment_key}_{cache_key}.pkl'
+    if cache_path.exists():
+        return pd.read_pickle(cache_path)
+
+    # Load metrics files; reading them is mostly waiting on the disk, so
+    # fetch them on a thread pool
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        loaded = list(executor.map(
+            lambda f: json.loads(Path(metrics_path, f).read_bytes()),
+            training_files + validation_files,
+        ))
+    training_metrics = loaded[:len(training_files)]
+    validation_metrics = loaded[len(training_files):]
     
     num_classes = training_metrics[0]['num_classes']
     
-    # Process into DataFrames (using your existing processing code)
-    training_df = pd.DataFrame([
-        {
-            'step': m['step'],
-            'epoch': m['epoch'],
-            'epoch_steps': m['total'],
-            'accuracy': m['true_positives'] / m['total'] if m['total'] > 0 else 0,
-            'experiment': experiment_name,
-            **{f'class_{k}_acc': m[str(k)]['true_positives']/m[str(k)]['total'] 
-               if m[str(k)]['total'] > 0 else 0 
-               for k in range(num_classes)}
-        }
-        for m in training_metrics
-    ])
-    
-    validation_df = pd.DataFrame([
-        {
-            'step': m['step'],
-            'epoch': m['epoch'],
-            'epoch_steps': m['total'],
-            'accuracy': m['true_positives'] / m['total'] if m['total'] > 0 else 0,
-            'experiment': experiment_name,
-            **{f'class_{k}_acc': m[str(k)]['true_positives']/m[str(k)]['total'] 
-               if m[str(k)]['total'] > 0 else 0 
-               for k in range(num_classes)}
-        }
-        for m in validation_metrics
-    ])
+    # Process into DataFrames
+    training_df = metrics_to_dataframe(training_metrics, experiment_name, num_classes)
+    validation_df = metrics_to_dataframe(validation_metrics, experiment_name, num_classes)
+
+    METRICS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for stale_cache in METRICS_CACHE_DIR.glob(f'{experiment_key}_*.pkl'):
+        stale_cache.unlink()
+    pd.to_pickle((training_df, validation_df, num_classes), cache_path)
     
     return training_df, validation_df, num_classes
 
+def epoch_mean_accuracy(df):
+    """Mean accuracy per epoch, the line sns.lineplot drew (without its
+    bootstrapped confidence band, which was most of the plotting time)."""
+    return df.groupby('epoch', sort=True)['accuracy'].mean()
+
 def plot_comparison_dashboard(experiment_names, friendly_names=None):
     """Create a comprehensive comparison dashboard."""
     if friendly_names is None:
@@ -60,20 +93,20 @@ def plot_comparison_dashboard(experiment_names, friendly_names=None):
     
     name_mapping = dict(zip(experiment_names, friendly_names))
     
-    # Load all experiment data
-    all_training = []
-    all_validation = []
+    # Load all experiment data, kept per experiment so the plots below don't
+    # have to filter a combined frame over and over
+    training_by_exp = {}
+    validation_by_exp = {}
     num_classes_per_exp = {}
     
     for exp_name in experiment_names:
         train_df, val_df, num_classes = load_experiment_data(exp_name)
-        all_training.append(train_df)
-        all_validation.append(val_df)
+        training_by_exp[exp_name] = train_df
+        validation_by_exp[exp_name] = val_df
         num_classes_per_exp[exp_name] = num_classes
     
-    # Combine all data
-    combined_training = pd.concat(all_training, ignore_index=True)
-    combined_validation = pd.concat(all_validation, ignore_index=True)
+    # Combine validation data (aligns class columns across experiments)
+    combined_validation = pd.concat(validation_by_exp.values(), ignore_index=True)
     
     # Set style for cleaner plots
     plt.style.use('seaborn-whitegrid')
@@ -85,9 +118,9 @@ def plot_comparison_dashboard(experiment_names, friendly_names=None):
     # 1. Overall Training Progress (top left)
     ax1 = fig.add_subplot(gs[0, 0])
     for exp_name in experiment_names:
-        exp_data = combined_training[combined_training['experiment'] == exp_name]
-        sns.lineplot(data=exp_data, x='epoch', y='accuracy', 
-                    label=name_mapping[exp_name], marker='o')
+        epoch_acc = epoch_mean_accuracy(training_by_exp[exp_name])
+        ax1.plot(epoch_acc.index, epoch_acc.values,
+                 label=name_mapping[exp_name], marker='o')
     
     ax1.set_title('Training Accuracy', fontsize=14, pad=10)
     ax1.set_xlabel('Epoch', fontsize=12)
@@ -101,21 +134,27 @@ def plot_comparison_dashboard(experiment_names, friendly_names=None):
     final_metrics = []
     
     for exp_name in experiment_names:
-        exp_val_data = combined_validation[combined_validation['experiment'] == exp_name]
+        exp_val_data = validation_by_exp[exp_name]
         final_metrics.append({
             'experiment': name_mapping[exp_name],
-            'Final Train': combined_training[combined_training['experiment'] == exp_name]['accuracy'].iloc[-1],
+            'Final Train': training_by_exp[exp_name]['accuracy'].iloc[-1],
             'Final Val': exp_val_data['accuracy'].iloc[-1],
             'Best Val': exp_val_data['accuracy'].max()
         })
     
     final_df = pd.DataFrame(final_metrics)
-    final_df_melted = pd.melt(final_df, 
-                             id_vars=['experiment'], 
-                             var_name='Metric',
-                             value_name='Accuracy')
     
-    sns.barplot(data=final_df_melted, x='experiment', y='Accuracy', hue='Metric', ax=ax2)
+    # Grouped bars: one group per experiment, one bar per metric
+    metric_names = ['Final Train', 'Final Val', 'Best Val']
+    positions = np.arange(len(final_df))
+    bar_width = 0.8 / len(metric_names)
+    for i, metric in enumerate(metric_names):
+        offset = (i - (len(metric_names) - 1) / 2) * bar_width
+        ax2.bar(positions + offset, final_df[metric].to_numpy(), bar_width, label=metric)
+    ax2.set_xticks(positions)
+    ax2.set_xticklabels(final_df['experiment'])
+    ax2.set_xlabel('experiment')
+    ax2.set_ylabel('Accuracy')
     ax2.set_title('Final Performance', fontsize=14, pad=10)
     # ax2.set_xticklabels(ax2.get_xticklabels(), rotation=30, ha='right')
     ax2.set_ylim(0, 1.0)
@@ -126,15 +165,12 @@ def plot_comparison_dashboard(experiment_names, friendly_names=None):
     ax3 = fig.add_subplot(gs[1, 0])
     
     class_columns = [col for col in combined_validation.columns if col.startswith('class_')]
-    final_class_accuracies = []
-    
-    for exp_name in experiment_names:
-        exp_data = combined_validation[combined_validation['experiment'] == exp_name]
-        final_row = exp_data.iloc[-1]
-        class_accs = [final_row[col] for col in class_columns]
-        final_class_accuracies.append(class_accs)
-    
-    class_acc_matrix = np.array(final_class_accuracies)
+    # Final row of each experiment, in experiment order
+    class_acc_matrix = (
+        combined_validation.groupby('experiment', sort=False)[class_columns]
+        .nth(-1)
+        .to_numpy()
+    )
     
     sns.heatmap(class_acc_matrix, 
                 annot=True, 
@@ -154,16 +190,18 @@ def plot_comparison_dashboard(experiment_names, friendly_names=None):
     ax4 = fig.add_subplot(gs[1, 1])
     
     for exp_name in experiment_names:
-        train_data = combined_training[combined_training['experiment'] == exp_name]
-        val_data = combined_validation[combined_validation['experiment'] == exp_name]
+        train_data = training_by_exp[exp_name]
+        val_data = validation_by_exp[exp_name]
         
-        sns.lineplot(data=train_data, x='epoch', y='accuracy', 
-                    label=f'{name_mapping[exp_name]} (train)',
-                    alpha=0.3, linestyle='--')
+        train_acc = epoch_mean_accuracy(train_data)
+        ax4.plot(train_acc.index, train_acc.values,
+                 label=f'{name_mapping[exp_name]} (train)',
+                 alpha=0.3, linestyle='--')
         
-        sns.lineplot(data=val_data, x='epoch', y='accuracy',
-                    label=f'{name_mapping[exp_name]} (val)',
-                    marker='o')
+        val_acc = epoch_mean_accuracy(val_data)
+        ax4.plot(val_acc.index, val_acc.values,
+                 label=f'{name_mapping[exp_name]} (val)',
+                 marker='o')
     
     ax4.set_title('Training vs Validation', fontsize=14, pad=10)
     ax4.set_xlabel('Epoch')
@@ -1,21 +1,24 @@
 # pip install pyserial
+import selectors
 import sys
 from utils import (
     create_serial_connection,
     find_stm32_port,
-    read_serial_line,
+    raise_thread_priority,
+    read_serial_lines,
 )
-import time
-import threading
 
 
 def read_serial():
     """Function to continuously read from serial port"""
-    while True:
-        line = read_serial_line(ser)
-        if line:
-            print(f"Received: {line}")
-        time.sleep(0.01)
+    rx_buffer = bytearray()
+    with selectors.DefaultSelector() as selector:
+        selector.register(ser.fd, selectors.EVENT_READ)
+        while True:
+            # Sleep in the kernel until the board sends something
+            selector.select()
+            for line in read_serial_lines(ser, rx_buffer):
+                print(f"Received: {line}")
 
 
 port = find_stm32_port()
@@ -25,17 +28,12 @@ if not port:
 
 print(f"Found port: {port}")
 ser = create_serial_connection(port)
+raise_thread_priority()
 
 try:
-    # Start the reading thread
-    read_thread = threading.Thread(target=read_serial, daemon=True)
-    read_thread.start()
-
     # listening for commands
     print("Listening for UART responses. Press Ctrl+C to exit")
-    while True:
-        # no cpu hogging
-        time.sleep(0.1)
+    read_serial()
 
 except KeyboardInterrupt:
     print("\nExiting...")
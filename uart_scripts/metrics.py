@@ -1,5 +1,7 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 import json
 import os
+from typing import Callable, List, Optional
 import numpy as np
 
 class MetricsTracker:
@@ -9,6 +11,7 @@ class MetricsTracker:
                  track_predictions: bool = False,
                  examples_per_class: int = 100,
                  random_seed: int = 42,
+                 writer_initializer: Optional[Callable[[], None]] = None,
                  ):
         """ Initialize metrics tracker
 
@@ -19,6 +22,8 @@ class MetricsTracker:
                 model: Model name
                 track_predictions: Whether to track predictions
                 examples_per_class: Number of examples per class to track
+                writer_initializer: Called on the background writer thread
+                    when it starts
         """
         metrics_path = os.path.join("metrics", run_name)
         self.metrics_path = metrics_path
@@ -28,13 +33,7 @@ class MetricsTracker:
         self.run_name = run_name
         self.num_classes = num_classes
         self.examples_per_class = examples_per_class
-        self.metrics = {
-            "true_positives": 0,
-            "total": 0,
-            "false_positives": 0,
-            **{class_id: {"true_positives": 0, "false_positives": 0, "total": 0} for class_id in range(num_classes)},
-            "run_time": 0,
-        }
+        self.run_time = 0
         self.mode = mode
         self.model = model
         self.epoch = 0
@@ -42,12 +41,19 @@ class MetricsTracker:
         self.random_seed = random_seed
         self.track_predictions = track_predictions
 
-        if track_predictions:
-            self.predicted_classes = []
-            self.true_classes = []
-        else:
-            self.predicted_classes = None
-            self.true_classes = None
+        # Recorded (predicted, true) class pairs; rows past num_predictions
+        # are unused capacity, and the buffer doubles when it fills up.
+        # Per-class counters are derived from these at report time.
+        capacity = num_classes * (examples_per_class or 100)
+        self.predictions = np.empty((max(capacity, 1), 2), dtype=np.int16)
+        self.num_predictions = 0
+
+        # Metrics files are written on a single background thread (so they
+        # land in order) to keep disk I/O out of the training loop
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, initializer=writer_initializer
+        )
+        self._pending_writes: List[Future] = []
 
     def val_mode(self):
         self.mode = "val"
@@ -60,31 +66,68 @@ class MetricsTracker:
         self.epoch += 1
         self.reset_metrics()
 
-    def update(self, predicted_class: int, true_class: int):
-        self.metrics["total"] += 1
-        self.metrics[true_class]["total"] += 1
-        if predicted_class == true_class:
-            self.metrics[true_class]["true_positives"] += 1
-            self.metrics["true_positives"] += 1
-        else:
-            self.metrics[predicted_class]["false_positives"] += 1
+    @property
+    def totals(self) -> np.ndarray:
+        """Number of samples seen per true class"""
+        true_classes = self.predictions[: self.num_predictions, 1]
+        return np.bincount(true_classes, minlength=self.num_classes)
 
-        if self.track_predictions:
-            self.true_classes.append(true_class)
-            self.predicted_classes.append(predicted_class)
+    @property
+    def true_positives(self) -> np.ndarray:
+        """Number of correct predictions per class"""
+        recorded = self.predictions[: self.num_predictions]
+        correct = recorded[:, 0] == recorded[:, 1]
+        return np.bincount(recorded[correct, 1], minlength=self.num_classes)
+
+    @property
+    def false_positives(self) -> np.ndarray:
+        """Number of wrong predictions per predicted class"""
+        recorded = self.predictions[: self.num_predictions]
+        wrong = recorded[:, 0] != recorded[:, 1]
+        return np.bincount(recorded[wrong, 0], minlength=self.num_classes)
+
+    @property
+    def metrics(self) -> dict:
+        """Counters in the layout written to the metrics JSON files"""
+        true_positives = self.true_positives.tolist()
+        false_positives = self.false_positives.tolist()
+        totals = self.totals.tolist()
+        return {
+            "true_positives": sum(true_positives),
+            "total": sum(totals),
+            "false_positives": sum(false_positives),
+            "run_time": self.run_time,
+            **{
+                class_id: {
+                    "true_positives": true_positives[class_id],
+                    "false_positives": false_positives[class_id],
+                    "total": totals[class_id],
+                }
+                for class_id in range(self.num_classes)
+            },
+        }
+
+    def update(self, predicted_class: int, true_class: int):
+        # Per-class counts are bincounts over [0, num_classes), so a class
+        # outside that range would misalign or break them; drop the pair
+        if not (0 <= predicted_class < self.num_classes
+                and 0 <= true_class < self.num_classes):
+            print(f"Ignoring out-of-range prediction {predicted_class} "
+                  f"for class {true_class} (num_classes={self.num_classes})")
+            self.step += 1
+            return
+        if self.num_predictions == len(self.predictions):
+            self.predictions = np.concatenate(
+                [self.predictions, np.empty_like(self.predictions)]
+            )
+        self.predictions[self.num_predictions] = (predicted_class, true_class)
+        self.num_predictions += 1
         
         self.step += 1
 
     def reset_metrics(self):
-        self.metrics = {
-            "true_positives": 0,
-            "total": 0,
-            "false_positives": 0,
-            "run_time": 0,
-            **{class_id: {"true_positives": 0, "false_positives": 0, "total": 0} for class_id in range(self.num_classes)},
-        }
-        self.predicted_classes = []
-        self.true_classes = []
+        self.run_time = 0
+        self.num_predictions = 0
 
     def save_metrics(self):
         model = self.model
@@ -92,7 +135,7 @@ class MetricsTracker:
         epoch = self.epoch
         step = self.step
 
-        metrics = self.metrics.copy()
+        metrics = self.metrics
         metrics["epoch"] = epoch
         metrics["step"] = step
         metrics["model"] = model
@@ -102,33 +145,53 @@ class MetricsTracker:
         metrics["num_classes"] = self.num_classes
         metrics["examples_per_class"] = self.examples_per_class
         if self.track_predictions:
-            metrics["predicted_classes"] = self.predicted_classes
-            metrics["true_classes"] = self.true_classes
+            recorded = self.predictions[: self.num_predictions]
+            metrics["predicted_classes"] = recorded[:, 0].tolist()
+            metrics["true_classes"] = recorded[:, 1].tolist()
         
         save_path = os.path.join(self.metrics_path, f"{mode}_{model}_{epoch}_{step}.json")
         print(f"[{mode}] [{epoch}/{step}] Saving metrics to {save_path}")
+        self._pending_writes = [w for w in self._pending_writes if not w.done()]
+        self._pending_writes.append(
+            self._writer.submit(self._write_metrics, save_path, metrics)
+        )
+
+    @staticmethod
+    def _write_metrics(save_path: str, metrics: dict):
         with open(save_path, "w") as f:
-            json.dump(metrics, f)
+            json.dump(metrics, f, separators=(",", ":"))
+
+    def flush(self):
+        """Wait for queued metrics files to be written, raising any write error"""
+        pending, self._pending_writes = self._pending_writes, []
+        for write in pending:
+            write.result()
 
     def get_accuracy(self, class_id=None):
         """Get accuracy overall or for specific class"""
+        true_positives = self.true_positives
+        totals = self.totals
         if class_id is not None:
-            metrics = self.metrics[class_id]
-            return metrics["true_positives"] / max(metrics["total"], 1)
+            return true_positives[class_id] / max(totals[class_id], 1)
         
-        total_correct = sum(self.metrics[i]["true_positives"] 
-                        for i in range(self.num_classes))
-        return total_correct / max(self.metrics["total"], 1)
+        return true_positives.sum() / max(totals.sum(), 1)
 
     
     def print_summary(self):
         """Print current metrics summary"""
-        print(f"\n[{self.mode}] Epoch {self.epoch}, Step {self.step}")
-        print(f"Overall accuracy: {self.get_accuracy():.3f}")
-        
-        print("\nPer-class metrics:")
-        all_class_metrics = [self.metrics[class_id] for class_id in range(self.num_classes)]
-        for class_id, class_metrics in enumerate(all_class_metrics):
-            acc = self.get_accuracy(class_id)
-            print(f"Class {class_id}: {acc:.3f} "
-              f"({class_metrics['true_positives']}/{class_metrics['total']} correct)")
+        true_positives = self.true_positives
+        totals = self.totals
+        accuracies = true_positives / np.maximum(totals, 1)
+
+        lines = [
+            f"\n[{self.mode}] Epoch {self.epoch}, Step {self.step}",
+            f"Overall accuracy: {true_positives.sum() / max(totals.sum(), 1):.3f}",
+            "\nPer-class metrics:",
+        ]
+        for class_id, (acc, num_correct, num_total) in enumerate(
+            zip(accuracies, true_positives, totals)
+        ):
+            lines.append(
+                f"Class {class_id}: {acc:.3f} ({num_correct}/{num_total} correct)"
+            )
+        print("\n".join(lines))
@@ -1,63 +1,51 @@
+import os
+from pathlib import Path
 import re
-import time
+import selectors
+import sys
 from typing import List, Optional
 
 # pip install pyserial to use this script
 import serial
 
 from utils import (
+    PROJECT_ROOT,
+    cbreak_stdin,
     create_serial_connection,
     find_stm32_port,
-    get_key,
-    read_serial_line,
+    raise_thread_priority,
+    read_serial_lines,
 )
 
 
+# Matches the body of the OUTPUT_LABELS array in OUTPUT_CH.h
+OUTPUT_LABELS_RE = re.compile(r"OUTPUT_LABELS\[\]\s*=\s*{([^}]+)}", re.DOTALL)
+# Matches one quoted label inside that array body
+LABEL_RE = re.compile(r"[\"']([^\"']+)[\"']")
+
+
 def parse_output_ch_header(file_path: str) -> List[str]:
     """Parse OUTPUT_CH.h to get the labels"""
     try:
-        with open(file_path, "r") as f:
-            content = f.read()
+        content = Path(file_path).read_text()
 
         # Find the array definition
-        array_match = re.search(
-            r"OUTPUT_LABELS\[\]\s*=\s*{([^}]+)}", content, re.DOTALL
-        )
+        array_match = OUTPUT_LABELS_RE.search(content)
         if not array_match:
             raise ValueError("Could not find OUTPUT_LABELS array in header file")
 
-        # Extract and clean up the labels
-        labels_text = array_match.group(1)
-        labels = [
-            label.strip().strip('"').strip("'")
-            for label in labels_text.split(",")
-            if label.strip()
-        ]
-
-        return labels
+        # Extract the quoted labels
+        return LABEL_RE.findall(array_match.group(1))
     except Exception as e:
         print(f"Error parsing OUTPUT_CH.h: {e}")
         return []
 
 
-def read_serial(ser: serial.Serial) -> None:
-    """Function to continuously read from serial port"""
-    while True:
-        line = read_serial_line(ser)
-        if line:
-            print(f"Received: {line}")
-        time.sleep(0.01)  # Sleep to prevent CPU hogging
-
-
 def main() -> None:
-    # Load labels from OUTPUT_CH.h
-    file_path = "Src/TinyEngine/include/OUTPUT_CH.h"
-    try:
-        labels = parse_output_ch_header(file_path)
-    except FileNotFoundError:
-        # If file not found, try with parent directory
-        file_path = "../" + file_path
-        labels = parse_output_ch_header(file_path)
+    # Load labels from OUTPUT_CH.h (found from the project root, so this works
+    # from any working directory)
+    file_path = str(PROJECT_ROOT / "Src/TinyEngine/include/OUTPUT_CH.h")
+    labels = parse_output_ch_header(file_path)
 
     if not labels:
         print("Failed to parse labels from OUTPUT_CH.h")
@@ -75,6 +63,7 @@ def main() -> None:
     ser: Optional[serial.Serial] = None
     try:
         ser = create_serial_connection(port)
+        raise_thread_priority()
 
         print("Connected to", port)
         print("\nCommands:")
@@ -97,17 +86,30 @@ def main() -> None:
         valid_classes = [str(i) for i in range(output_channel)]
         valid_commands += valid_classes
 
-        while True:
-            key = get_key()
-
-            if key.lower() == "q":
-                break
-
-            if key in valid_commands:
-                print(f"\nSending command: {key}")
-                ser.write(key.encode())
-            elif key == "\x03":  # Ctrl+C
-                raise KeyboardInterrupt
+        # Wait on keypresses and board output together: stdin stays in cbreak
+        # mode for the whole session, so each key is readable on its own
+        rx_buffer = bytearray()
+        with cbreak_stdin(), selectors.DefaultSelector() as selector:
+            selector.register(sys.stdin, selectors.EVENT_READ, "stdin")
+            selector.register(ser.fd, selectors.EVENT_READ, "serial")
+            running = True
+            while running:
+                for event, _ in selector.select():
+                    if event.data == "serial":
+                        for line in read_serial_lines(ser, rx_buffer):
+                            print(f"Received: {line}")
+                        continue
+
+                    key = os.read(sys.stdin.fileno(), 1).decode(errors="ignore")
+                    if key.lower() == "q":
+                        running = False
+                        break
+
+                    if key in valid_commands:
+                        print(f"\nSending command: {key}")
+                        ser.write(key.encode())
+                    elif key == "\x03":  # Ctrl+C
+                        raise KeyboardInterrupt
 
     except serial.SerialException as e:
         print(f"Error: {e}")
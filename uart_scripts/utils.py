@@ -1,10 +1,12 @@
+import contextlib
+import functools
 import sys
 import termios
 import time
 import tty
 import serial
 import serial.tools.list_ports
-from typing import Optional, Dict, List, Tuple
+from typing import Iterator, Optional, Dict, List, Tuple
 import os
 import glob
 import subprocess
@@ -15,16 +17,44 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).parent.parent
 
 
-def find_stm32_port() -> Optional[str]:
+# How long a found STM32 port is trusted before enumerating ports again
+PORT_CACHE_SECONDS = 5.0
+# Longest the board is given to come back up after a flash or reset
+BOOT_TIMEOUT_SECONDS = 5.0
+# How long one boot probe is given to be answered before it is sent again;
+# longer than one pass of the firmware's main loop (camera capture + inference)
+BOOT_PROBE_TIMEOUT_SECONDS = 1.5
+_port_cache = {"port": None, "found_at": 0.0}
+
+
+def find_stm32_port(force_refresh: bool = False) -> Optional[str]:
     """Find the STM32 board port.
 
+    A port found in the last PORT_CACHE_SECONDS is reused as long as its
+    device node still exists, since enumerating ports is comparatively slow.
+
+    Args:
+        force_refresh (bool): Whether to enumerate ports even if one is cached
+
     Returns:
         str | None: Port name if found, None otherwise
     """
+    cached = _port_cache["port"]
+    if (
+        not force_refresh
+        and cached is not None
+        and time.monotonic() - _port_cache["found_at"] < PORT_CACHE_SECONDS
+        and os.path.exists(cached)
+    ):
+        return cached
+
     ports = serial.tools.list_ports.comports()
     for port in ports:
         if "usbmodem" in port.device.lower():
+            _port_cache["port"] = port.device
+            _port_cache["found_at"] = time.monotonic()
             return port.device
+    _port_cache["port"] = None
     return None
 
 
@@ -37,49 +67,168 @@ def create_serial_connection(port: str) -> serial.Serial:
     Returns:
         serial.Serial: Configured serial connection
     """
-    return serial.Serial(
-        port=port,
-        baudrate=115200,
-        bytesize=serial.EIGHTBITS,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        timeout=0.1,
-    )
-
+    try:
+        ser = serial.Serial(
+            port=port,
+            baudrate=115200,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=0.05,
+        )
+    except serial.SerialException:
+        # don't hand out a port that can't be opened again
+        _port_cache["port"] = None
+        raise
+    # On Linux, ask the driver to hand over bytes as soon as they arrive
+    # (ASYNC_LOW_LATENCY) rather than batching them; not every driver allows
+    # it, and pyserial raises NotImplementedError for it on other platforms
+    if is_linux():
+        try:
+            ser.set_low_latency_mode(True)
+        except (IOError, ValueError, NotImplementedError):
+            pass
+    return ser
 
-def get_key() -> str:
-    """Get a single keypress from the user.
 
-    Returns:
-        str: The character pressed
-    """
+@contextlib.contextmanager
+def cbreak_stdin() -> Iterator[None]:
+    """Deliver keypresses on stdin one at a time, without echo, for the
+    duration of the block (Ctrl+C still interrupts)."""
     fd = sys.stdin.fileno()
     old_settings = termios.tcgetattr(fd)
     try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
+        tty.setcbreak(fd)
+        yield
     finally:
         termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
 
 
-def read_serial_line(ser: serial.Serial) -> Optional[str]:
-    """Read a line from the serial port if available.
+def read_serial_lines(ser: serial.Serial, buffer: bytearray) -> List[str]:
+    """Read everything waiting on the serial port and return the complete lines.
 
     Args:
         ser (serial.Serial): Serial connection to read from
+        buffer (bytearray): Per-port buffer holding a partial line between calls
 
     Returns:
-        str | None: Decoded line if available, None otherwise
+        List[str]: Decoded, non-empty lines (possibly none)
     """
-    if ser.in_waiting:
+    try:
+        buffer += ser.read(max(1, ser.in_waiting))
+    except serial.SerialException as e:
+        print(f"Error reading serial: {e}")
+        return []
+
+    *raw_lines, partial = buffer.split(b"\n")
+    buffer[:] = partial
+    lines = []
+    for raw_line in raw_lines:
+        line = raw_line.decode("utf-8", "replace").strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+# Scheduling settings a thread had before raise_thread_priority raised them,
+# so that worker threads it starts afterwards can drop back to them
+_normal_priority: Dict[str, int] = {}
+
+
+def raise_thread_priority() -> None:
+    """Raise the calling thread's scheduling priority so serial reads on it are
+    serviced promptly
+
+    On Linux scheduling settings are per thread and are inherited by threads
+    started afterwards, so those should call reset_thread_priority first
+    (elsewhere the nice fallback applies to the whole process). Real-time
+    scheduling needs CAP_SYS_NICE on Linux; without it fall back to a lower
+    nice value, and leave the priority alone if that isn't allowed either.
+    """
+    if is_linux():
+        _normal_priority.update(
+            policy=os.sched_getscheduler(0),
+            priority=os.sched_getparam(0).sched_priority,
+            niceness=os.getpriority(os.PRIO_PROCESS, 0),
+        )
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        return
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(-5)
+    except OSError:
+        pass
+
+
+def reset_thread_priority() -> None:
+    """Drop the calling thread back to the scheduling priority it had before
+    raise_thread_priority; meant as the initializer of worker threads
+
+    Only needed on Linux, where worker threads inherit the raised priority.
+    """
+    if not is_linux() or not _normal_priority:
+        return
+    try:
+        os.sched_setscheduler(
+            0, _normal_priority["policy"], os.sched_param(_normal_priority["priority"])
+        )
+        os.setpriority(os.PRIO_PROCESS, 0, _normal_priority["niceness"])
+    except OSError:
+        pass
+
+
+def wait_for_device_boot(timeout: float = BOOT_TIMEOUT_SECONDS) -> bool:
+    """Wait until the firmware's main loop is answering commands
+
+    Sends the inference mode command, which is the mode the firmware boots
+    into so it changes nothing, and waits for the board to acknowledge it. It
+    is only sent again once BOOT_PROBE_TIMEOUT_SECONDS pass without an answer,
+    and every probe sent is accounted for before returning, so no late probe
+    is left to mix into the next command's output. If the board can't be
+    reached over serial, this just waits out the timeout.
+
+    Args:
+        timeout (float): Longest time to wait, in seconds
+
+    Returns:
+        bool: True if the board answered, False if the timeout ran out
+    """
+    deadline = time.monotonic() + timeout
+    port = find_stm32_port()
+    if port:
         try:
-            line = ser.readline().decode("utf-8").strip()
-            if line:
-                return line
-        except Exception as e:
-            print(f"Error reading serial: {e}")
-    return None
+            with create_serial_connection(port) as ser:
+                rx_buffer = bytearray()
+                probes_sent = probes_answered = 0
+                probe_deadline = 0.0
+                while True:
+                    now = time.monotonic()
+                    if probes_answered:
+                        # give any other probes still in flight time to be answered
+                        if probes_answered >= probes_sent or now >= probe_deadline:
+                            ser.reset_input_buffer()
+                            return True
+                    elif now >= probe_deadline:
+                        if now >= deadline:
+                            break
+                        ser.write(b"i")
+                        probes_sent += 1
+                        probe_deadline = now + BOOT_PROBE_TIMEOUT_SECONDS
+                    # each read waits at most the connection's timeout
+                    for line in read_serial_lines(ser, rx_buffer):
+                        if line.startswith("COMMAND RECEIVED: i"):
+                            probes_answered += 1
+                            probe_deadline = time.monotonic() + BOOT_PROBE_TIMEOUT_SECONDS
+        # SerialException covers most failures; opening or configuring the
+        # port can also raise plain OSError or ValueError
+        except (serial.SerialException, OSError, ValueError):
+            pass
+
+    time.sleep(max(0.0, deadline - time.monotonic()))
+    return False
+
 
 def get_versioned_path(path_pattern):
     """
@@ -97,26 +246,58 @@ CUBE_IDE_PATHS = [
 ]
 
 
+# The platform can't change while running, so check it once
+IS_MACOS = sys.platform == "darwin"
+IS_WINDOWS = sys.platform == "win32"
+IS_LINUX = sys.platform.startswith("linux")
+
+
 def is_macos() -> bool:
     """Check if running on macOS"""
-    return os.uname().sysname == "Darwin"
+    return IS_MACOS
 
 
 def is_windows() -> bool:
     """Check if running on Windows"""
-    return os.name == "nt"
+    return IS_WINDOWS
 
 
 def is_linux() -> bool:
     """Check if running on Linux"""
-    return os.uname().sysname == "Linux"
+    return IS_LINUX
+
+
+# Environment for build commands, taken once at import: the CubeIDE toolchain
+# (where installed) goes ahead of the user's own PATH
+_BUILD_ENV = {
+    **os.environ,
+    "PATH": ":".join(
+        [path for path in CUBE_IDE_PATHS if path] + [os.environ.get("PATH", "")]
+    ),
+}
 
 
 def get_build_env() -> dict:
     """Get environment variables for building"""
-    env = os.environ.copy()
-    env["PATH"] = ":".join(CUBE_IDE_PATHS + [env.get("PATH", "")])
-    return env
+    # a plain dict copy, so callers can't change the shared one
+    return dict(_BUILD_ENV)
+
+
+# Lines make echoes when it invokes the compiler, i.e. when a file is rebuilt
+COMPILER_COMMAND_PREFIXES = ("arm-none-eabi-g++", "arm-none-eabi-gcc")
+
+
+def _make_command(*targets: str) -> List[str]:
+    """Build a make invocation that runs one job per core, backing off under load
+
+    When run from a parent make (MAKEFLAGS is set), its jobserver decides the
+    parallelism instead.
+    """
+    cmd = ["make"]
+    if "MAKEFLAGS" not in os.environ:
+        jobs = str(os.cpu_count() or 1)
+        cmd += [f"-j{jobs}", "-l", jobs]
+    return cmd + list(targets)
 
 
 def clean_project(
@@ -131,7 +312,7 @@ def clean_project(
     try:
         print("Cleaning project...")
         result = subprocess.run(
-            ["make", "-j7", "clean"],
+            _make_command("clean"),
             cwd=build_dir,
             env=get_build_env(),
             check=True,
@@ -164,30 +345,34 @@ def build_project(
     """
     try:
         print("Building project...")
-        cmd = ["make", "-j7"]
         if force_rebuild:
-            cmd.append("clean")
-            cmd.append("all")
+            cmd = _make_command("clean", "all")
         else:
-            cmd.append("all")
+            cmd = _make_command("all")
 
-        result = subprocess.run(
+        # Stream the output (stderr folded in, so the log keeps its order) and
+        # check for compiler commands as lines arrive to see if anything was rebuilt
+        was_rebuilt = False
+        output_lines = []
+        with subprocess.Popen(
             cmd,
             cwd=build_dir,
             env=get_build_env(),
-            check=True,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-        )
-
-        if verbose:
-            print(result.stdout)
-
-        # Check if any files were rebuilt by looking for compiler commands in output
-        was_rebuilt = any(
-            line.startswith("arm-none-eabi-g++") or line.startswith("arm-none-eabi-gcc")
-            for line in result.stdout.splitlines()
-        )
+        ) as process:
+            for line in process.stdout:
+                output_lines.append(line)
+                if verbose:
+                    print(line, end="")
+                if not was_rebuilt and line.startswith(COMPILER_COMMAND_PREFIXES):
+                    was_rebuilt = True
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, cmd, output="".join(output_lines)
+            )
 
         if was_rebuilt:
             print("Files were rebuilt")
@@ -199,10 +384,11 @@ def build_project(
     except subprocess.CalledProcessError as e:
         print(f"Error during build: {e}")
         if e.output:
-            print(f"Build output:\n{e.output} {e.stderr}")
+            print(f"Build output:\n{e.output}")
         raise
 
 
+@functools.lru_cache(maxsize=1)
 def get_programmer_path() -> str:
     """Get the path to the STM32 programmer CLI"""
     if is_macos():
@@ -211,7 +397,7 @@ def get_programmer_path() -> str:
     elif is_windows():
         path = "STM32_Programmer_CLI"  # TODO: Add proper Windows path
     else:
-        raise RuntimeError(f"Unsupported OS: {os.uname().sysname}")
+        raise RuntimeError(f"Unsupported OS: {sys.platform}")
 
     if not os.path.exists(path):
         raise RuntimeError(
@@ -224,31 +410,28 @@ def get_programmer_path() -> str:
 def deploy_binary(
     binary_path: str = str(PROJECT_ROOT / "Debug" / "TTE_demo_mcunet.elf"),
     verbose: bool = False,
+    verify: bool = True,
 ) -> None:
     """Deploy binary to the microcontroller
 
     Args:
         binary_path (str): Path to the binary file
         verbose (bool): Whether to print the output of the command
+        verify (bool): Whether to read the flash back and check it after writing
     """
     try:
         programmer = get_programmer_path()
-        cmd = [
-            programmer,
-            "--connect",
-            "port=SWD",
-            "--write",
-            binary_path,
-            "--verify",
-            "-rst",
-        ]
+        cmd = [programmer, "--connect", "port=SWD", "--write", binary_path]
+        if verify:
+            cmd.append("--verify")
+        cmd.append("-rst")
 
         print(f"Deploying binary: {binary_path}")
         result = subprocess.run(cmd, check=True, capture_output=True, text=True)
         if verbose:
             print(result.stdout)
-        # sleep for 5 seconds to allow the device to boot
-        time.sleep(5)
+        if not wait_for_device_boot():
+            print("Device did not respond after deployment, continuing anyway")
         print("Deployment complete")
     except subprocess.CalledProcessError as e:
         print(f"Error during deployment: {e}")
@@ -266,7 +449,8 @@ def reset_device(verbose: bool = False) -> None:
         result = subprocess.run(cmd, check=True, capture_output=True, text=True)
         if verbose:
             print(result.stdout)
-        time.sleep(5)  # Allow device to reboot
+        if not wait_for_device_boot():
+            print("Device did not respond after reset, continuing anyway")
         print("Reset complete")
     except subprocess.CalledProcessError as e:
         print(f"Error during reset: {e}")
@@ -277,15 +461,17 @@ def reset_device(verbose: bool = False) -> None:
 def load_datasets(base_path: str) -> Dict[str, List[str]]:
     """Load datasets from the datasets folder"""
     datasets = {}
-    base = Path(base_path)
-
-    # List all directories in datasets folder
-    for dataset_dir in base.iterdir():
-        if dataset_dir.is_dir():
-            # Get class names from subdirectories, and sort them to ensure consistent order
-            datasets[dataset_dir.name] = sorted(
-                d.name for d in dataset_dir.iterdir() if d.is_dir()
-            )
+
+    # List all directories in datasets folder; scandir entries answer is_dir()
+    # from the directory listing itself, without a stat() per entry
+    with os.scandir(base_path) as dataset_dirs:
+        for dataset_dir in dataset_dirs:
+            if dataset_dir.is_dir():
+                # Get class names from subdirectories, and sort them to ensure consistent order
+                with os.scandir(dataset_dir.path) as class_dirs:
+                    datasets[dataset_dir.name] = sorted(
+                        d.name for d in class_dirs if d.is_dir()
+                    )
 
     if not datasets:
         raise RuntimeError("No datasets found")
@@ -293,8 +479,12 @@ def load_datasets(base_path: str) -> Dict[str, List[str]]:
     return datasets
 
 
-def update_output_ch_file(class_names: List[str], file_path: str):
-    """Update the OUTPUT_CH and labels in the specified file"""
+def update_output_ch_file(class_names: List[str], file_path: str) -> bool:
+    """Update the OUTPUT_CH and labels in the specified file
+
+    Returns:
+        bool: True if the file was written, False if it was already up to date
+    """
     class_names_str = ",\n".join([f'"{class_name}"' for class_name in class_names])
     new_contents = f"""// GENERATED FILE FROM AUTOMATED TRAINING SCRIPT
 
@@ -309,26 +499,39 @@ static const char *const OUTPUT_LABELS[] = {{
 
 #endif // OUTPUT_CH_H                
 """
-    # only write if contents have changed
-    with open(file_path, "r") as file:
-        current_contents = file.read()
+    # only write if contents have changed, so the file's mtime (and make's
+    # view of what needs rebuilding) is left alone when nothing changed
+    new_bytes = new_contents.encode()
+    path = Path(file_path)
+    try:
+        if path.read_bytes() == new_bytes:
+            return False
+    except FileNotFoundError:
+        pass
 
-    if current_contents != new_contents:
-        with open(file_path, "w") as file:
-            file.write(new_contents)
+    # write to a temporary file and rename it over the header, so an
+    # interrupted run can't leave a truncated OUTPUT_CH.h behind
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(new_bytes)
+    os.replace(tmp_path, path)
+    return True
 
 
 def select_dataset(preselected: Optional[str] = None) -> Tuple[str, List[str]]:
-    """Interactive dataset selection, returns (dataset_path, class_names)"""
+    """Interactive dataset selection, returns (dataset_path, class_names)
+
+    The prompt is skipped when a dataset name is preselected, either by the
+    caller or through the TINY_TRAINING_DATASET environment variable (for
+    scripted runs).
+    """
     datasets = load_datasets(str(PROJECT_ROOT / "datasets/data"))
     if not datasets:
         raise RuntimeError("No datasets found")
 
-    print("\nAvailable datasets:")
-    for idx, name in enumerate(datasets.keys()):
-        print(f"{idx + 1}: {name}")
-    print()
+    menu = "\n".join(f"{idx + 1}: {name}" for idx, name in enumerate(datasets))
+    print(f"\nAvailable datasets:\n{menu}\n")
 
+    preselected = preselected or os.environ.get("TINY_TRAINING_DATASET")
     if preselected:
         # throw if not in datasets
         if preselected not in datasets:
@@ -362,15 +565,20 @@ def smart_build_and_deploy(
     build_dir: str = str(PROJECT_ROOT / "Debug"),
     binary_path: str = str(PROJECT_ROOT / "Debug" / "TTE_demo_mcunet.elf"),
     verbose: bool = False,
+    verify: bool = False,
 ) -> None:
-    """Smart build and deploy - uses Make's incremental build"""
+    """Smart build and deploy - uses Make's incremental build
+
+    The flash readback is skipped by default, since this is the quick path
+    taken on every run; pass verify=True to check the written binary.
+    """
 
     # Run incremental build
     was_rebuilt = build_project(build_dir, verbose)
 
     if was_rebuilt:
         print("Changes detected, deploying new binary...")
-        deploy_binary(binary_path, verbose)
+        deploy_binary(binary_path, verbose, verify)
     else:
         print("No changes detected, just resetting device...")
         reset_device(verbose)